@@ -4,64 +4,308 @@ Chat service using Google Gemini API
 """
 
 import asyncio
+import hashlib
 import logging
+import time
+import uuid
+from collections import OrderedDict
+from functools import lru_cache
 from typing import Optional, Dict, Any
 import httpx
 import google.generativeai as genai
 from models import ChatRequest, ChatResponse, validate_message, sanitize_text
+from token_estimator import estimate_tokens
+
+# Optional semantic-cache dependencies - exact-match caching works without them
+try:
+    import faiss
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+    SEMANTIC_CACHE_AVAILABLE = True
+except ImportError:
+    SEMANTIC_CACHE_AVAILABLE = False
 
 logger = logging.getLogger("puch.chat")
 
+# Response cache tuning
+CACHE_MAX_ENTRIES = 1024
+EMBEDDING_DIM = 384
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+SEMANTIC_SIM_THRESHOLD = 0.92
+
+# Prefix (context) caching: contexts at least this many estimated tokens are
+# uploaded once via Gemini's cached_content API instead of resent per call
+MIN_PREFIX_CACHE_TOKENS = 1024
+PREFIX_CACHE_TTL = "10m"
+# Refresh local handles a little before the upstream TTL elapses so a
+# request never races the server-side expiry
+PREFIX_CACHE_TTL_SECONDS = 600.0
+PREFIX_CACHE_SAFETY_SECONDS = 30.0
+
+# Cap on concurrent in-flight Gemini calls for rate-limit smoothing
+GEMINI_MAX_CONCURRENCY = 8
+
+# Prompt template fragments, hoisted so the build is plain concatenation
+_PREFIX = "Context: "
+_INFIX = "\n\nUser: "
+
+@lru_cache(maxsize=256)
+def _sanitize_context_cached(ctx: str) -> str:
+    """Memoized sanitize_text for contexts repeated across a session"""
+    return sanitize_text(ctx)
+
 class ChatService:
     def __init__(self, api_key: str, model: str = "gemini-2.0-flash-exp"):
         self.api_key = api_key
         self.model = model
         self._client: Optional[genai.GenerativeModel] = None
+        self._gemini_gate = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
         self._setup_client()
-    
+
+        # Semantic response cache: exact-match LRU fast path plus an optional
+        # embedding-similarity fallback for near-duplicate prompts.
+        # Each entry stores (response, prev_prompt_hash) so contextual
+        # follow-ups don't get false hits from a different conversation chain.
+        self._exact: "OrderedDict[bytes, tuple]" = OrderedDict()
+        # Chain position for sessionless calls; sessions carry their own
+        # prev_prompt_hash so interleaved conversations don't invalidate
+        # each other's chains
+        self._prev_prompt_hash: Optional[bytes] = None
+
+        # Chat sessions and shared server-side context caches. Contexts are
+        # hashed with blake2b so equal contexts across sessions share one
+        # cached_content entry upstream.
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._context_caches: Dict[bytes, Any] = {}
+        self._embedder = None
+        self._sem_index = None
+        self._sem_entries: list = []
+        if SEMANTIC_CACHE_AVAILABLE:
+            try:
+                self._embedder = SentenceTransformer(EMBEDDING_MODEL)
+                self._sem_index = faiss.IndexFlatIP(EMBEDDING_DIM)
+                logger.info("Semantic cache enabled (embedding-similarity fallback)")
+            except Exception as e:
+                logger.warning("Semantic cache unavailable, using exact-match only: %s", e)
+                self._embedder = None
+                self._sem_index = None
+        else:
+            logger.info("faiss/sentence-transformers not installed, using exact-match cache only")
+
     def _setup_client(self):
         """Initialize the Gemini client"""
         try:
             genai.configure(api_key=self.api_key)
             self._client = genai.GenerativeModel(self.model)
-            logger.info(f"Gemini client initialized with model: {self.model}")
+            logger.info("Gemini client initialized with model: %s", self.model)
         except Exception as e:
-            logger.error(f"Failed to initialize Gemini client: {e}")
+            logger.error("Failed to initialize Gemini client: %s", e)
             raise
     
-    async def process_message(self, message: str, context: Optional[str] = None) -> ChatResponse:
+    def start_session(self) -> str:
+        """Start a chat session that can elide repeated context prefixes"""
+        session_id = uuid.uuid4().hex
+        self._sessions[session_id] = {
+            "cached_content_name": None,
+            "prefix_tokens": 0,
+            "prev_prompt_hash": None,
+        }
+        logger.info("Chat session started: %s", session_id)
+        return session_id
+
+    async def _get_prefix_model(self, session: Dict[str, Any], clean_context: str) -> Optional[genai.GenerativeModel]:
+        """
+        Return a model bound to a server-side cached copy of the context, or
+        None when the context is too short or the caching API is unavailable.
+        """
+        # Rough token estimate (~4 chars/token); short contexts aren't worth a cache entry
+        prefix_tokens = len(clean_context) // 4
+        if prefix_tokens < MIN_PREFIX_CACHE_TOKENS:
+            return None
+
+        ctx_hash = hashlib.blake2b(clean_context.encode("utf-8"), digest_size=16).digest()
+        now = time.monotonic()
+        cached = None
+        entry = self._context_caches.get(ctx_hash)
+        if entry is not None:
+            cached, expires_at = entry
+            if now >= expires_at:
+                # The upstream entry has (or is about to have) expired;
+                # drop the stale handle and create a fresh one below
+                del self._context_caches[ctx_hash]
+                cached = None
+        if cached is None:
+            try:
+                # CachedContent.create is a blocking network call; run it in
+                # a worker thread so the event loop keeps serving requests
+                cached = await asyncio.to_thread(
+                    genai.caching.CachedContent.create,
+                    model=self.model,
+                    contents=[clean_context],
+                    ttl=PREFIX_CACHE_TTL
+                )
+                expires_at = now + PREFIX_CACHE_TTL_SECONDS - PREFIX_CACHE_SAFETY_SECONDS
+                self._context_caches[ctx_hash] = (cached, expires_at)
+                logger.info("Created context cache %s (~%d tokens)", cached.name, prefix_tokens)
+            except Exception as e:
+                logger.warning("Context cache creation failed, sending full context: %s", e)
+                return None
+
+        session["cached_content_name"] = cached.name
+        session["prefix_tokens"] = prefix_tokens
+
+        try:
+            return genai.GenerativeModel.from_cached_content(cached_content=cached)
+        except Exception as e:
+            logger.warning("Could not bind model to context cache: %s", e)
+            return None
+
+    def _evict_context_cache(self, clean_context: str) -> None:
+        """Drop the local handle for a context whose upstream entry is gone"""
+        ctx_hash = hashlib.blake2b(clean_context.encode("utf-8"), digest_size=16).digest()
+        self._context_caches.pop(ctx_hash, None)
+
+    def _advance_chain(self, session: Optional[Dict[str, Any]], key: bytes) -> None:
+        """Record the latest prompt hash on the session's chain (or global)"""
+        if session is not None:
+            session["prev_prompt_hash"] = key
+        else:
+            self._prev_prompt_hash = key
+
+    @staticmethod
+    def _cache_key(context: Optional[str], clean_message: str) -> bytes:
+        """Stable cache key over (sanitized_context, clean_message)"""
+        raw = (context or "") + "\x00" + clean_message
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).digest()
+
+    def _cache_lookup(self, key: bytes, context: Optional[str], clean_message: str,
+                      prev_hash: Optional[bytes]) -> Optional[ChatResponse]:
+        """Check exact-match cache, then the semantic index if available"""
+        entry = self._exact.get(key)
+        if entry is not None:
+            response, stored_prev = entry
+            # A hit needs the same conversation position as when the entry
+            # was stored; key == prev_hash is the back-to-back repeat of the
+            # same prompt, which is always safe to serve
+            if stored_prev == prev_hash or key == prev_hash:
+                self._exact.move_to_end(key)
+                logger.info("Chat cache hit (exact)")
+                return response
+
+        if self._sem_index is not None and self._sem_index.ntotal > 0:
+            try:
+                vec = self._embed(context, clean_message)
+                distances, indices = self._sem_index.search(vec, 1)
+                if distances[0, 0] > SEMANTIC_SIM_THRESHOLD:
+                    entry_key, response, stored_prev = self._sem_entries[indices[0, 0]]
+                    if stored_prev == prev_hash or entry_key == prev_hash:
+                        logger.info("Chat cache hit (semantic, sim=%.3f)", distances[0, 0])
+                        return response
+            except Exception as e:
+                logger.warning("Semantic cache lookup failed: %s", e)
+
+        return None
+
+    def _cache_store(self, key: bytes, context: Optional[str], clean_message: str,
+                     response: ChatResponse, prev_hash: Optional[bytes]):
+        """Insert a successful response into both cache layers"""
+        self._exact[key] = (response, prev_hash)
+        self._exact.move_to_end(key)
+        while len(self._exact) > CACHE_MAX_ENTRIES:
+            self._exact.popitem(last=False)
+
+        if self._sem_index is not None:
+            try:
+                # IndexFlatIP has no per-row eviction, so the semantic layer
+                # is flushed wholesale once it reaches the exact-cache bound
+                if self._sem_index.ntotal >= CACHE_MAX_ENTRIES:
+                    self._sem_index.reset()
+                    self._sem_entries.clear()
+                self._sem_index.add(self._embed(context, clean_message))
+                self._sem_entries.append((key, response, prev_hash))
+            except Exception as e:
+                logger.warning("Semantic cache insert failed: %s", e)
+
+    def _embed(self, context: Optional[str], clean_message: str):
+        """Embed a prompt as a normalized vector for cosine similarity search"""
+        raw = (context or "") + "\x00" + clean_message
+        vec = self._embedder.encode([raw]).astype(np.float32)
+        faiss.normalize_L2(vec)
+        return vec
+
+    async def process_message(self, message: str, context: Optional[str] = None,
+                              session_id: Optional[str] = None) -> ChatResponse:
         """Process a chat message using Gemini API"""
-        logger.info("Processing chat message", extra={"message_len": len(message)})
-        
+        # Gate the per-request log so nothing is allocated when INFO is filtered
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Processing chat message (len=%d)", len(message))
+
         # Validate input
         validation_error = validate_message(message)
         if validation_error:
-            logger.warning("Invalid chat message", extra={"error": validation_error})
+            logger.warning("Invalid chat message: %s", validation_error)
             return ChatResponse(
                 ok=False,
                 error="validation",
                 detail=validation_error
             )
-        
+
         # Sanitize input
         clean_message = sanitize_text(message)
-        
+        clean_context = _sanitize_context_cached(context) if context else None
+
+        session = self._sessions.get(session_id) if session_id else None
+        prev_hash = session["prev_prompt_hash"] if session else self._prev_prompt_hash
+
+        # Repeated or near-duplicate prompts short-circuit the Gemini call
+        key = self._cache_key(clean_context, clean_message)
+        cached = self._cache_lookup(key, clean_context, clean_message, prev_hash)
+        if cached is not None:
+            self._advance_chain(session, key)
+            return cached
+
         try:
+            # In a session with a long context, the context lives in a
+            # server-side cache and only the message delta is transmitted
+            prefix_model = await self._get_prefix_model(session, clean_context) if session and clean_context else None
+
             # Prepare the prompt
-            if context:
-                prompt = f"Context: {sanitize_text(context)}\n\nUser: {clean_message}"
+            if prefix_model is not None:
+                prompt = clean_message
+            elif clean_context:
+                # join performs one allocation + memcpy, instead of the
+                # intermediate strings "+" chains build for large contexts
+                prompt = "".join((_PREFIX, clean_context, _INFIX, clean_message))
             else:
                 prompt = clean_message
-            
+
             # Make the API call
-            response = await self._make_gemini_request(prompt)
-            
-            return ChatResponse(
+            if prefix_model is not None:
+                try:
+                    response = await self._make_gemini_request(prompt, client=prefix_model)
+                except Exception as e:
+                    # The server-side entry can vanish before our local TTL
+                    # (quota pressure, clock skew); evict the handle and
+                    # retry once with the full context inlined
+                    logger.warning("Cached-context request failed, resending full context: %s", e)
+                    self._evict_context_cache(clean_context)
+                    prompt = "".join((_PREFIX, clean_context, _INFIX, clean_message))
+                    response = await self._make_gemini_request(prompt)
+            else:
+                response = await self._make_gemini_request(prompt)
+
+            chat_response = ChatResponse(
                 ok=True,
                 response=response.text,
-                usage={"prompt_tokens": len(prompt), "completion_tokens": len(response.text)}
+                usage={"prompt_tokens": estimate_tokens(prompt), "completion_tokens": estimate_tokens(response.text)}
             )
-            
+
+            # Cache the successful response and advance the conversation chain
+            self._cache_store(key, clean_context, clean_message, chat_response, prev_hash)
+            self._advance_chain(session, key)
+
+            return chat_response
+
         except Exception as e:
             logger.error("Error processing chat message", exc_info=True)
             return ChatResponse(
@@ -70,17 +314,13 @@ class ChatService:
                 detail=str(e)
             )
     
-    async def _make_gemini_request(self, prompt: str):
+    async def _make_gemini_request(self, prompt: str, client: Optional[genai.GenerativeModel] = None):
         """Make async request to Gemini API"""
-        if not self._client:
+        client = client or self._client
+        if not client:
             raise RuntimeError("Gemini client not initialized")
-        
-        # Run the blocking Gemini call in a thread pool
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
-            None, 
-            self._client.generate_content, 
-            prompt
-        )
-        
-        return response
\ No newline at end of file
+
+        # Native async call - no thread pool hop, and the semaphore keeps
+        # bursty load from exceeding upstream rate limits
+        async with self._gemini_gate:
+            return await client.generate_content_async(prompt)
\ No newline at end of file
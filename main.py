@@ -27,11 +27,11 @@ import asyncio
 import logging
 import argparse
 import signal
-import threading
-import time
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 
+import httpx
 from dotenv import load_dotenv
 from mcp.server.fastmcp import FastMCP
 from chat_service import ChatService
@@ -78,13 +78,13 @@ def setup_logging(log_level: str = "INFO", log_file: str = "puch_chatbot.log"):
     file_handler.setFormatter(file_formatter)
     root_logger.addHandler(file_handler)
     
-    logger.info(f"Logging configured - Level: {log_level}, File: {log_dir / log_file}")
+    logger.info("Logging configured - Level: %s, File: %s", log_level, log_dir / log_file)
 
 def setup_signal_handlers():
     """Setup graceful shutdown signal handlers"""
     def signal_handler(signum, frame):
         signal_name = signal.Signals(signum).name
-        logger.info(f"Received {signal_name} signal, initiating graceful shutdown...")
+        logger.info("Received %s signal, initiating graceful shutdown...", signal_name)
         shutdown_event.set()
     
     # Register signal handlers
@@ -100,75 +100,125 @@ mcp = FastMCP("Puch.AI Chatbot Server")
 chat_service: Optional[ChatService] = None
 search_service: Optional[SearchService] = None
 
+# Config memoization - load_config re-reads and re-parses .env, so the hot
+# paths go through get_config(), which only reloads if the API keys rotate
+@lru_cache(maxsize=1)
+def _load_config_cached(_fingerprint: int) -> ServerConfig:
+    return load_config()
+
+def get_config() -> ServerConfig:
+    """Return the process-wide config, re-parsing only when the keys change"""
+    fingerprint = hash((os.getenv("OPENWEATHER_API_KEY"), os.getenv("GEMINI_API_KEY")))
+    return _load_config_cached(fingerprint)
+
+# Shared HTTP client - reused across requests so TLS handshakes are paid
+# once and requests multiplex over pooled HTTP/2 connections
+_HTTP: Optional[httpx.AsyncClient] = None
+_HTTP_LOCK = asyncio.Lock()
+
+async def get_http() -> httpx.AsyncClient:
+    """Return the shared async HTTP client, creating it on first use"""
+    global _HTTP
+    async with _HTTP_LOCK:
+        if _HTTP is None:
+            _HTTP = httpx.AsyncClient(
+                http2=True,
+                timeout=10.0,
+                limits=httpx.Limits(max_keepalive_connections=20, max_connections=100)
+            )
+        return _HTTP
+
+# Optional config vars: env name -> (ServerConfig field, default, coercion)
+_CONFIG_DEFAULTS: Dict[str, Tuple[str, str, type]] = {
+    "OPENWEATHER_BASE_URL": ("openweather_base_url", "https://api.openweathermap.org/data/2.5/weather", str),
+    "GEMINI_MODEL": ("gemini_model", "gemini-2.0-flash-exp", str),
+    "SEARCH_USER_AGENT": ("search_user_agent", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36", str),
+    "SEARCH_TIMEOUT": ("search_timeout", "10", int),
+    "SEARCH_MAX_RESULTS": ("search_max_results", "10", int),
+    "LOG_LEVEL": ("log_level", "INFO", str),
+    "LOG_FILE": ("log_file", "puch_chatbot.log", str),
+}
+
+def _strip_quotes(s: str) -> str:
+    """Remove symmetric surrounding quotes from an env value"""
+    return s[1:-1] if len(s) > 1 and s[0] == s[-1] and s[0] in ("'", '"') else s
+
 def load_config() -> ServerConfig:
     """Load configuration from .env file and environment variables"""
     # Load .env file if it exists
     env_path = Path(".env")
     if env_path.exists():
         load_dotenv(env_path)
-        logger.info(f"Loaded configuration from {env_path}")
+        logger.info("Loaded configuration from %s", env_path)
     else:
         logger.info("No .env file found, using environment variables only")
-    
+
     # Get required API keys
     openweather_key = os.getenv("OPENWEATHER_API_KEY")
     gemini_key = os.getenv("GEMINI_API_KEY")
-    
+
     # Validate required configuration
     missing_vars = []
     if not openweather_key:
         missing_vars.append("OPENWEATHER_API_KEY")
     if not gemini_key:
         missing_vars.append("GEMINI_API_KEY")
-    
+
     if missing_vars:
         error_msg = f"Missing required environment variables: {', '.join(missing_vars)}"
         logger.error(error_msg)
         raise ValueError(error_msg)
-    
+
     # Mask API keys in logs for security
-    logger.info(f"OpenWeather API key loaded: {openweather_key[:8]}...")
-    logger.info(f"Gemini API key loaded: {gemini_key[:8]}...")
-    
-    # Helper function to clean environment values (remove quotes if present)
-    def clean_env_value(value, default):
-        if not value:
-            return default
-        # Remove surrounding quotes if present
-        if value.startswith('"') and value.endswith('"'):
-            value = value[1:-1]
-        elif value.startswith("'") and value.endswith("'"):
-            value = value[1:-1]
-        return value
-    
+    logger.info("OpenWeather API key loaded: %s...", openweather_key[:8])
+    logger.info("Gemini API key loaded: %s...", gemini_key[:8])
+
+    # Pull the optional vars in a single pass, stripping quotes and
+    # applying defaults/coercions from the table
+    raw = {k: _strip_quotes(os.getenv(k) or default) for k, (_, default, _) in _CONFIG_DEFAULTS.items()}
+
     return ServerConfig(
-        openweather_api_key=clean_env_value(openweather_key, ""),
-        gemini_api_key=clean_env_value(gemini_key, ""),
-        gemini_model=clean_env_value(os.getenv("GEMINI_MODEL"), "gemini-2.0-flash-exp"),
-        openweather_base_url=clean_env_value(os.getenv("OPENWEATHER_BASE_URL"), "https://api.openweathermap.org/data/2.5/weather"),
-        search_user_agent=clean_env_value(os.getenv("SEARCH_USER_AGENT"), "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"),
-        search_timeout=int(clean_env_value(os.getenv("SEARCH_TIMEOUT"), "10")),
-        search_max_results=int(clean_env_value(os.getenv("SEARCH_MAX_RESULTS"), "10")),
-        log_level=clean_env_value(os.getenv("LOG_LEVEL"), "INFO"),
-        log_file=clean_env_value(os.getenv("LOG_FILE"), "puch_chatbot.log")
+        openweather_api_key=_strip_quotes(openweather_key),
+        gemini_api_key=_strip_quotes(gemini_key),
+        **{field: coerce(raw[k]) for k, (field, _, coerce) in _CONFIG_DEFAULTS.items()}
     )
 
 @mcp.tool()
-async def chat(message: str, context: Optional[str] = None) -> Dict[str, Any]:
+async def start_chat_session() -> Dict[str, Any]:
+    """
+    Start a chat session for multi-turn conversations
+
+    Passing the returned session_id to chat() lets the server reuse a
+    cached copy of long conversation contexts instead of resending them
+    with every message.
+
+    Returns:
+        Dict with the new session_id or error information
+    """
+    if not chat_service:
+        return {"ok": False, "error": "service_unavailable", "detail": "Chat service not initialized"}
+
+    return {"ok": True, "session_id": chat_service.start_session()}
+
+@mcp.tool()
+async def chat(message: str, context: Optional[str] = None,
+               session_id: Optional[str] = None) -> Dict[str, Any]:
     """
     Chat with AI using Gemini 2.5 Flash
-    
+
     Args:
         message: Your message to the AI
         context: Optional conversation context
-        
+        session_id: Optional session from start_chat_session() for
+            multi-turn conversations with a shared context
+
     Returns:
         Dict with AI response or error information
     """
     if not chat_service:
         return {"ok": False, "error": "service_unavailable", "detail": "Chat service not initialized"}
-    
-    response = await chat_service.process_message(message, context)
+
+    response = await chat_service.process_message(message, context, session_id)
     return {
         "ok": response.ok,
         "response": response.response,
@@ -197,10 +247,10 @@ async def search_web(query: str, num_results: int = 5) -> Dict[str, Any]:
         "ok": response.ok,
         "results": [
             {
-                "title": r.title,
-                "snippet": r.snippet,
-                "url": r.url
-            } for r in response.results
+                "title": t,
+                "snippet": s,
+                "url": u
+            } for t, s, u in zip(response.titles, response.snippets, response.urls)
         ],
         "query": response.query,
         "error": response.error,
@@ -225,34 +275,32 @@ async def get_weather(city: str, units: str = "metric") -> Dict[str, Any]:
         return await puch_weather(city, units)
     except ImportError:
         # Fallback simple implementation
-        import httpx
-        
-        config = load_config()
+        config = get_config()
         params = {
             "q": city,
             "appid": config.openweather_api_key,
             "units": units
         }
-        
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(config.openweather_base_url, params=params)
-                if response.status_code == 200:
-                    data = response.json()
-                    return {
-                        "ok": True,
-                        "city": data.get("name"),
-                        "country": data.get("sys", {}).get("country"),
-                        "temp": data.get("main", {}).get("temp"),
-                        "feels_like": data.get("main", {}).get("feels_like"),
-                        "humidity": data.get("main", {}).get("humidity"),
-                        "conditions": data.get("weather", [{}])[0].get("description"),
-                        "units": units
-                    }
-                else:
-                    return {"ok": False, "error": "api_error", "detail": f"Weather API returned {response.status_code}"}
-            except Exception as e:
-                return {"ok": False, "error": "internal", "detail": str(e)}
+
+        client = await get_http()
+        try:
+            response = await client.get(config.openweather_base_url, params=params)
+            if response.status_code == 200:
+                data = response.json()
+                return {
+                    "ok": True,
+                    "city": data.get("name"),
+                    "country": data.get("sys", {}).get("country"),
+                    "temp": data.get("main", {}).get("temp"),
+                    "feels_like": data.get("main", {}).get("feels_like"),
+                    "humidity": data.get("main", {}).get("humidity"),
+                    "conditions": data.get("weather", [{}])[0].get("description"),
+                    "units": units
+                }
+            else:
+                return {"ok": False, "error": "api_error", "detail": f"Weather API returned {response.status_code}"}
+        except Exception as e:
+            return {"ok": False, "error": "internal", "detail": str(e)}
 
 async def test_chat(message: str):
     """Test chat functionality"""
@@ -287,90 +335,71 @@ async def test_weather(city: str):
 
 async def cleanup_services():
     """Cleanup services on shutdown"""
-    global chat_service, search_service
+    global chat_service, search_service, _HTTP
     logger.info("Cleaning up services...")
-    
-    # Add any cleanup logic here
-    # For example, closing HTTP clients, database connections, etc.
-    
+
+    # Close the shared HTTP clients
+    if search_service is not None:
+        await search_service.aclose()
+    if _HTTP is not None:
+        await _HTTP.aclose()
+        _HTTP = None
+
     logger.info("Services cleaned up successfully")
 
-class ProductionMCPServer:
-    """Production-ready MCP server with proper lifecycle management"""
-    
-    def __init__(self):
-        self.server_thread = None
-        self.is_running = False
-        self.shutdown_requested = False
-    
-    def start_server_thread(self):
-        """Start MCP server in a separate thread"""
-        def run_mcp():
-            try:
-                logger.info("MCP server thread starting...")
-                mcp.run()
-            except Exception as e:
-                logger.error(f"MCP server thread error: {e}", exc_info=True)
-            finally:
-                logger.info("MCP server thread stopped")
-                self.is_running = False
-        
-        self.server_thread = threading.Thread(target=run_mcp, daemon=False)
-        self.server_thread.start()
-        self.is_running = True
-        logger.info("MCP server thread started successfully")
-    
-    def stop_server(self):
-        """Stop the MCP server gracefully"""
-        logger.info("Stopping MCP server...")
-        self.shutdown_requested = True
-        
-        if self.server_thread and self.server_thread.is_alive():
-            # Give the server thread time to shutdown gracefully
-            self.server_thread.join(timeout=5.0)
-            if self.server_thread.is_alive():
-                logger.warning("MCP server thread did not shutdown gracefully")
-        
-        self.is_running = False
-        logger.info("MCP server stopped")
+async def _monitor():
+    """Log a periodic health status while the server runs"""
+    # Wake only on shutdown or on the 5-minute boundary - no per-second polling
+    while True:
+        try:
+            await asyncio.wait_for(shutdown_event.wait(), timeout=300.0)
+            break  # shutdown triggered
+        except asyncio.TimeoutError:
+            logger.info("Server health check: MCP server is running")
 
 async def run_server():
     """Run MCP server with graceful shutdown and health monitoring"""
     logger.info("Starting production MCP server...")
-    
+
     # Setup signal handlers for graceful shutdown
     setup_signal_handlers()
-    
-    # Create production server instance
-    server = ProductionMCPServer()
-    
+
+    logger.info("=== MCP SERVER READY ===")
+    logger.info("Server is running and accepting MCP connections")
+    logger.info("Available tools: chat, start_chat_session, search_web, get_weather")
+    logger.info("Press Ctrl+C to shutdown gracefully")
+    logger.info("========================")
+
+    # MCP dispatch, health monitor and shutdown watch all share the event
+    # loop - no background thread, no cross-thread coordination
+    server_task = asyncio.create_task(mcp.run_stdio_async())
+    monitor_task = asyncio.create_task(_monitor())
+    shutdown_task = asyncio.create_task(shutdown_event.wait())
+
     try:
-        # Start the MCP server
-        server.start_server_thread()
-        
-        logger.info("=== MCP SERVER READY ===")
-        logger.info("Server is running and accepting MCP connections")
-        logger.info("Available tools: chat, search_web, get_weather")
-        logger.info("Press Ctrl+C to shutdown gracefully")
-        logger.info("========================")
-        
-        # Health monitoring loop
-        while server.is_running and not shutdown_event.is_set():
-            await asyncio.sleep(1.0)
-            
-            # Log periodic health status
-            if int(time.time()) % 300 == 0:  # Every 5 minutes
-                logger.info("Server health check: MCP server is running")
-        
-        logger.info("Shutdown signal received, stopping server...")
-        
+        # Race the server against the shutdown signal so Ctrl+C cancels cleanly
+        done, pending = await asyncio.wait(
+            {server_task, shutdown_task},
+            return_when=asyncio.FIRST_COMPLETED
+        )
+
+        if shutdown_task in done:
+            logger.info("Shutdown signal received, stopping server...")
+
+        monitor_task.cancel()
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(monitor_task, *pending, return_exceptions=True)
+
+        if server_task in done and server_task.exception():
+            raise server_task.exception()
+
     except KeyboardInterrupt:
         logger.info("Keyboard interrupt received, shutting down...")
     except Exception as e:
-        logger.error(f"Server error: {e}", exc_info=True)
+        logger.error("Server error: %s", e, exc_info=True)
     finally:
         # Cleanup
-        server.stop_server()
         await cleanup_services()
         logger.info("=== SERVER SHUTDOWN COMPLETE ===")
 
@@ -385,25 +414,41 @@ async def run_persistent_server():
     logger.info("Server starting in persistent mode...")
     logger.info("This server will run continuously until stopped")
     logger.info("Available MCP tools:")
-    logger.info("  - chat(message, context?) - AI chat with Gemini")
+    logger.info("  - chat(message, context?, session_id?) - AI chat with Gemini")
+    logger.info("  - start_chat_session() - session for multi-turn chat")
     logger.info("  - search_web(query, num_results?) - Web search")
     logger.info("  - get_weather(city, units?) - Weather information")
     logger.info("=============================")
     
     try:
-        # Run the server indefinitely
+        # Run the server indefinitely, waking only on shutdown or server exit
         while not shutdown_event.is_set():
-            try:
-                # Start MCP server in executor to avoid blocking
-                await asyncio.get_event_loop().run_in_executor(None, mcp.run)
-            except Exception as e:
-                logger.error(f"MCP server error: {e}", exc_info=True)
-                if not shutdown_event.is_set():
-                    logger.info("Restarting MCP server in 5 seconds...")
-                    await asyncio.sleep(5)
-                    continue
+            server_task = asyncio.create_task(mcp.run_stdio_async())
+            shutdown_task = asyncio.create_task(shutdown_event.wait())
+
+            done, pending = await asyncio.wait(
+                {server_task, shutdown_task},
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+            if shutdown_task in done:
                 break
-    
+
+            exc = server_task.exception()
+            if exc:
+                logger.error("MCP server error: %s", exc, exc_info=exc)
+                logger.info("Restarting MCP server in 5 seconds...")
+                try:
+                    # Sleep that still reacts immediately to shutdown
+                    await asyncio.wait_for(shutdown_event.wait(), timeout=5.0)
+                    break
+                except asyncio.TimeoutError:
+                    continue
+            break
+
     except KeyboardInterrupt:
         logger.info("Keyboard interrupt received")
     finally:
@@ -415,7 +460,7 @@ def run_server_blocking():
     logger.info("Starting MCP server in blocking mode...")
     logger.info("=== MCP SERVER STARTING ===")
     logger.info("Server will handle MCP connections on stdio")
-    logger.info("Available tools: chat, search_web, get_weather")
+    logger.info("Available tools: chat, start_chat_session, search_web, get_weather")
     logger.info("===========================")
     
     try:
@@ -424,7 +469,7 @@ def run_server_blocking():
     except KeyboardInterrupt:
         logger.info("Server stopped by user")
     except Exception as e:
-        logger.error(f"Server error: {e}", exc_info=True)
+        logger.error("Server error: %s", e, exc_info=True)
     finally:
         logger.info("=== MCP SERVER STOPPED ===")
 
@@ -463,15 +508,15 @@ Environment Variables (can be set in .env file):
     
     try:
         # Load configuration
-        config = load_config()
+        config = get_config()
         
         # Setup logging with config or override
         log_level = args.log_level or config.log_level
         setup_logging(log_level, config.log_file)
         
         logger.info("=== Puch.AI MCP Chatbot Server Starting ===")
-        logger.info(f"Python version: {sys.version}")
-        logger.info(f"Working directory: {Path.cwd()}")
+        logger.info("Python version: %s", sys.version)
+        logger.info("Working directory: %s", Path.cwd())
         
         if args.config:
             print("\n=== Current Configuration ===")
@@ -509,7 +554,7 @@ Environment Variables (can be set in .env file):
         search_service = SearchService(config.search_user_agent, config.search_timeout)
         logger.info("All services initialized successfully")
     except Exception as e:
-        logger.error(f"Service initialization failed: {e}", exc_info=True)
+        logger.error("Service initialization failed: %s", e, exc_info=True)
         print(f"Failed to initialize services: {e}")
         return 1
     
@@ -539,7 +584,7 @@ Environment Variables (can be set in .env file):
         logger.info("Received keyboard interrupt, shutting down...")
         return 0
     except Exception as e:
-        logger.error(f"Unexpected error: {e}", exc_info=True)
+        logger.error("Unexpected error: %s", e, exc_info=True)
         print(f"Unexpected error: {e}")
         return 1
     finally:
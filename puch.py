@@ -30,15 +30,36 @@ import sys
 import re
 import json
 import time
+import email.utils
+import atexit
+import queue
+import random
 import signal
 import asyncio
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 from typing import Optional, Dict, Any
 
 import httpx
 from mcp.server.fastmcp import FastMCP
 
+# orjson serializes small dicts several times faster than the stdlib;
+# fall back to json when it isn't installed
+try:
+    import orjson
+
+    def _json_dumps(payload: Dict[str, Any]) -> str:
+        return orjson.dumps(payload).decode()
+
+    def _json_loads(buf: bytes) -> Any:
+        return orjson.loads(buf)
+except ImportError:
+    def _json_dumps(payload: Dict[str, Any]) -> str:
+        return json.dumps(payload)
+
+    def _json_loads(buf: bytes) -> Any:
+        return json.loads(buf)
+
 # ------------------------------
 # Configuration & Validation
 # ------------------------------
@@ -50,6 +71,14 @@ DEFAULT_UNITS = os.getenv("OPENWEATHER_UNITS", "metric")
 CITY_MAX_LEN = 80
 CITY_RE = re.compile(r"^[A-Za-z0-9 \-.,']+$")
 
+# Allowed-character set for the ASCII fast path in _validate_city; C-level
+# set membership beats spinning up the regex engine for typical city names
+_CITY_ALLOWED = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 -.,'")
+
+# Params template - the API key never changes for the process lifetime, and
+# keeping it here also keeps it out of ad-hoc debug dumps of locals
+_BASE_PARAMS: Dict[str, str] = {"appid": API_KEY} if API_KEY else {}
+
 # ------------------------------
 # Observability (Logging)
 # ------------------------------
@@ -63,7 +92,6 @@ logger.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
 console_handler = logging.StreamHandler()
 console_fmt = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 console_handler.setFormatter(console_fmt)
-logger.addHandler(console_handler)
 
 # Rotating file handler (structured JSON-ish lines)
 file_handler = RotatingFileHandler(LOG_FILE, maxBytes=5 * 1024 * 1024, backupCount=5)
@@ -71,17 +99,50 @@ file_handler = RotatingFileHandler(LOG_FILE, maxBytes=5 * 1024 * 1024, backupCou
 class JsonLineFormatter(logging.Formatter):
     def format(self, record: logging.LogRecord) -> str:
         payload = {
-            "ts": int(time.time()),
+            "ts": int(record.created),  # already captured by logging, no extra syscall
             "logger": record.name,
             "level": record.levelname,
             "msg": record.getMessage(),
         }
-        if record.exc_info:
-            payload["exc"] = self.formatException(record.exc_info)
-        return json.dumps(payload)
+        # Queued records arrive with exc_info stripped and the traceback
+        # pre-rendered onto exc_text by the queue handler; the exc_info
+        # branch renders (and caches, as the stdlib Formatter does) for
+        # records that reach this formatter directly
+        if not record.exc_text and record.exc_info:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload["exc"] = record.exc_text
+        return _json_dumps(payload)
 
 file_handler.setFormatter(JsonLineFormatter())
-logger.addHandler(file_handler)
+
+class _PassthroughQueueHandler(QueueHandler):
+    """
+    QueueHandler whose prepare() leaves formatting to the listener.
+
+    The stock prepare() formats the whole record on the emitting thread
+    with the handler's default Formatter and nulls exc_info/exc_text,
+    which merges tracebacks into msg and defeats the point of the queue.
+    Only the traceback is rendered here - the exception frames should not
+    stay alive until the listener drains the queue - and it is left on
+    exc_text for the listener's formatters to emit.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _EXC_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+_EXC_FORMATTER = logging.Formatter()
+
+# Emitting coroutines only enqueue the record; formatting and file I/O
+# happen on the listener thread, off the event-loop critical path
+_LOG_QUEUE: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+logger.addHandler(_PassthroughQueueHandler(_LOG_QUEUE))
+_LOG_LISTENER = QueueListener(_LOG_QUEUE, console_handler, file_handler, respect_handler_level=True)
+_LOG_LISTENER.start()
+atexit.register(_LOG_LISTENER.stop)
 
 # ------------------------------
 # HTTP Client (async, reused)
@@ -90,14 +151,24 @@ logger.addHandler(file_handler)
 HTTP_CLIENT: Optional[httpx.AsyncClient] = None
 HTTP_CLIENT_LOCK = asyncio.Lock()
 
-DEFAULT_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
-DEFAULT_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20)
+# Distinct per-stage budgets: a slow handshake can't eat the whole
+# request budget, and a hung read is cut early enough to retry
+DEFAULT_TIMEOUT = httpx.Timeout(connect=3.0, read=5.0, write=2.0, pool=1.0)
+# Sized for the combined MCP + WhatsApp deployment's fan-out; the 15s
+# keepalive expiry (vs httpx's 5s default) keeps warm TLS connections
+# alive between steady-state polls
+DEFAULT_LIMITS = httpx.Limits(max_connections=1000, max_keepalive_connections=100, keepalive_expiry=15.0)
 
 async def get_http_client() -> httpx.AsyncClient:
     global HTTP_CLIENT
     async with HTTP_CLIENT_LOCK:
         if HTTP_CLIENT is None:
-            HTTP_CLIENT = httpx.AsyncClient(timeout=DEFAULT_TIMEOUT, limits=DEFAULT_LIMITS)
+            HTTP_CLIENT = httpx.AsyncClient(
+                timeout=DEFAULT_TIMEOUT,
+                limits=DEFAULT_LIMITS,
+                http2=True,
+                headers={"User-Agent": "puch-weather/1.0"},
+            )
         return HTTP_CLIENT
 
 # ------------------------------
@@ -108,32 +179,66 @@ mcp = FastMCP("Puch.AI Weather Server")
 # Retry/backoff parameters
 MAX_RETRIES = 3
 BACKOFF_BASE = 0.8  # seconds
+MAX_DELAY = 30.0  # cap on any single retry delay
+JITTER = 0.5  # random spread so concurrent clients don't retry in lockstep
+
+
+def _compute_delay(attempt: int, resp: Optional[httpx.Response] = None) -> float:
+    """Retry delay: honor an upstream Retry-After header, else jittered exponential backoff"""
+    if resp is not None:
+        retry_after = resp.headers.get("Retry-After")
+        if retry_after:
+            # Seconds form first, HTTP-date form as fallback
+            try:
+                return min(MAX_DELAY, max(0.0, float(int(retry_after))))
+            except ValueError:
+                try:
+                    dt = email.utils.parsedate_to_datetime(retry_after)
+                    return min(MAX_DELAY, max(0.0, dt.timestamp() - time.time()))
+                except (TypeError, ValueError):
+                    pass
+
+    return min(MAX_DELAY, BACKOFF_BASE * (2 ** (attempt - 1)) * (1 + random.random() * JITTER))
+
 
 async def _fetch_with_retries(params: Dict[str, Any]) -> httpx.Response:
     client = await get_http_client()
     last_exc: Optional[Exception] = None
+    last_resp: Optional[httpx.Response] = None
 
     for attempt in range(1, MAX_RETRIES + 1):
         try:
             resp = await client.get(BASE_URL, params=params)
 
-            # If rate-limited, attempt backoff and retry
-            if resp.status_code == 429:
-                wait = BACKOFF_BASE * (2 ** (attempt - 1))
-                logger.warning(f"Rate limited (429). Backing off {wait}s and retrying (attempt {attempt}).")
+            # Rate limits and server errors are recoverable: back off and retry.
+            # Other 4xx are unrecoverable - retrying a bad request won't help.
+            if resp.status_code == 429 or resp.status_code >= 500:
+                last_resp = resp
+                # No retry follows the last attempt - sleeping here would
+                # only delay returning the response we already have
+                if attempt == MAX_RETRIES:
+                    break
+                wait = _compute_delay(attempt, resp)
+                logger.warning(f"Upstream {resp.status_code}. Backing off {wait:.2f}s and retrying (attempt {attempt}).")
                 await asyncio.sleep(wait)
                 continue
 
             return resp
 
-        except (httpx.ReadTimeout, httpx.ConnectTimeout, httpx.NetworkError) as exc:
+        except (httpx.ReadTimeout, httpx.ConnectTimeout, httpx.WriteTimeout,
+                httpx.PoolTimeout, httpx.NetworkError) as exc:
             last_exc = exc
-            wait = BACKOFF_BASE * (2 ** (attempt - 1))
-            logger.warning(f"Transient HTTP error on attempt {attempt}: {exc!r}. Backing off {wait}s.")
+            if attempt == MAX_RETRIES:
+                break
+            wait = _compute_delay(attempt)
+            logger.warning(f"Transient HTTP error ({type(exc).__name__}) on attempt {attempt}: {exc!r}. Backing off {wait:.2f}s.")
             await asyncio.sleep(wait)
             continue
 
-    # all retries exhausted
+    # all retries exhausted - surface the last response so callers can
+    # report the upstream status, otherwise re-raise the last exception
+    if last_resp is not None:
+        return last_resp
     raise last_exc or RuntimeError("Unknown error during HTTP fetch")
 
 
@@ -143,6 +248,21 @@ def _mask_key(key: Optional[str]) -> str:
     return "*" * max(0, len(key) - 4) + key[-4:]
 
 
+# In-process TTL cache - OpenWeather data changes on a minute timescale,
+# so repeat lookups within the TTL skip the HTTP round-trip entirely
+_WEATHER_CACHE: Dict[tuple, tuple] = {}
+_CACHE_TTL = 60.0  # seconds
+_CACHE_MAX_ENTRIES = 1024
+
+
+def _cache_evict_expired(now: float) -> None:
+    """Lazily drop expired entries once the cache grows past its cap"""
+    if len(_WEATHER_CACHE) > _CACHE_MAX_ENTRIES:
+        cutoff = now - _CACHE_TTL
+        for key in [k for k, (ts, _) in _WEATHER_CACHE.items() if ts < cutoff]:
+            del _WEATHER_CACHE[key]
+
+
 def _validate_city(city: str) -> Optional[str]:
     if not isinstance(city, str):
         return "City must be a string."
@@ -151,6 +271,9 @@ def _validate_city(city: str) -> Optional[str]:
         return "City cannot be empty."
     if len(s) > CITY_MAX_LEN:
         return f"City too long (max {CITY_MAX_LEN} chars)."
+    # Fast path: typical ASCII city names never touch the regex engine
+    if s.isascii() and all(c in _CITY_ALLOWED for c in s):
+        return None
     if not CITY_RE.match(s):
         return "City contains invalid characters."
     return None
@@ -159,30 +282,45 @@ def _validate_city(city: str) -> Optional[str]:
 @mcp.tool()
 async def get_weather(city: str, units: str = DEFAULT_UNITS) -> Dict[str, Any]:
     """MCP tool: returns a structured JSON-like dict with weather or an error."""
-    logger.info("get_weather called", extra={"city": city, "units": units})
+    # Gate hot-path logs so filtered levels never pay for the extra dict
+    # or the LogRecord construction
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("get_weather called", extra={"city": city, "units": units})
 
     if not API_KEY:
         logger.critical("Missing OPENWEATHER_API_KEY; aborting request.")
         return {"ok": False, "error": "server_configuration", "detail": "Missing API key"}
 
-    # validate inputs
-    v_err = _validate_city(city)
+    # validate inputs; strip once and reuse the result everywhere below
+    q = city.strip() if isinstance(city, str) else city
+    v_err = _validate_city(q)
     if v_err:
         logger.warning("Invalid input for get_weather", extra={"city": city, "error": v_err})
         return {"ok": False, "error": "invalid_input", "detail": v_err}
 
     units = units if units in ("metric", "imperial") else DEFAULT_UNITS
 
-    params = {"q": city.strip(), "appid": API_KEY, "units": units}
+    # Serve recent results from the in-process cache
+    cache_key = (q.lower(), units)
+    now = time.monotonic()
+    entry = _WEATHER_CACHE.get(cache_key)
+    if entry and now - entry[0] < _CACHE_TTL:
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Weather cache hit", extra={"city": cache_key[0], "units": units})
+        return entry[1]
+
+    params = {"q": q, "units": units, **_BASE_PARAMS}
 
     try:
         resp = await _fetch_with_retries(params)
 
         if resp.status_code == 200:
-            data = resp.json()
+            # orjson parses the raw bytes in native code, skipping httpx's
+            # stdlib-json path on every successful lookup
+            data = _json_loads(resp.content)
             main = data.get("main", {})
-            weather_arr = data.get("weather", [])
-            first = weather_arr[0] if weather_arr else {}
+            weather_arr = data.get("weather") or [{}]
+            first = weather_arr[0]
 
             result = {
                 "ok": True,
@@ -196,7 +334,10 @@ async def get_weather(city: str, units: str = DEFAULT_UNITS) -> Dict[str, Any]:
                 "units": units,
             }
 
-            logger.info("Weather fetch successful", extra={"city": result["city"], "units": units})
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Weather fetch successful", extra={"city": result["city"], "units": units})
+            _cache_evict_expired(now)
+            _WEATHER_CACHE[cache_key] = (now, result)
             return result
 
         if resp.status_code == 401:
@@ -204,8 +345,8 @@ async def get_weather(city: str, units: str = DEFAULT_UNITS) -> Dict[str, Any]:
             return {"ok": False, "error": "auth", "detail": "Authentication failed with upstream"}
 
         if resp.status_code == 404:
-            logger.warning("City not found", extra={"q": city})
-            return {"ok": False, "error": "not_found", "detail": f"No weather data for {city.strip()}"}
+            logger.warning("City not found", extra={"q": q})
+            return {"ok": False, "error": "not_found", "detail": f"No weather data for {q}"}
 
         # Other unexpected status
         logger.error("Upstream error", extra={"status": resp.status_code, "text": resp.text})
@@ -5,23 +5,108 @@ Search service using web scraping (no API keys required)
 
 import asyncio
 import logging
+import re
+import time
 import urllib.parse
 from typing import List, Optional
 import httpx
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from models import SearchResult, SearchResponse, validate_search_query, sanitize_text
 
 logger = logging.getLogger("puch.search")
 
+# Only materialize div subtrees - results live in divs, and skipping
+# head/script/style avoids allocating nodes that are thrown away
+_STRAINER = SoupStrainer("div")
+
+# All known Google result-container selectors in one union, matched in a
+# single pass (Google changes their HTML structure frequently)
+_RESULT_SELECTOR = "div.g, div[data-sokoban-container], div.tF2Cxc, div.MjjYud"
+
+# Per-result selectors and URL checks, hoisted out of the hot loop
+_TITLE_SELECTOR = "h3, .LC20lb, .DKV0Md"
+_SNIPPET_SELECTOR = ".aCOpRe, .VwiC3b, .s3v9rd, .st, .IsZvec"
+_GOOGLE_REDIRECT_RE = re.compile(r"^/url\?q=([^&]+)")
+_HTTP_PREFIXES = ("http://", "https://")
+
+# Preferred path: parse with lxml.html and CSS selectors compiled to XPath
+# once per process instead of once per select() call. BeautifulSoup stays
+# as the fallback when lxml is missing.
+try:
+    from lxml import etree
+    from lxml import html as lxml_html
+    from lxml.cssselect import CSSSelector
+    _SEL_RESULT = CSSSelector(_RESULT_SELECTOR)
+    _SEL_TITLE = CSSSelector(_TITLE_SELECTOR)
+    _SEL_SNIPPET = CSSSelector(_SNIPPET_SELECTOR)
+    _SEL_LINK = CSSSelector("a[href]")
+    # Fallback: the nearest div ancestor of every h3, resolved in libxml2
+    _SEL_H3_DIV_ANCESTOR = etree.XPath("//h3/ancestor::div[1]")
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+class _Bucket:
+    """Minimal async token bucket - only bursts beyond capacity ever wait"""
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.ts = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def take(self):
+        """Consume one token, sleeping only when the bucket is empty"""
+        async with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.ts) * self.rate)
+            self.ts = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return
+            wait = (1.0 - self.tokens) / self.rate
+            self.tokens = 0.0
+        await asyncio.sleep(wait)
+
 class SearchService:
     def __init__(self, user_agent: str, timeout: int = 10):
         self.user_agent = user_agent
         self.timeout = timeout
         self.base_url = "https://www.google.com/search"
-        
+        # Lazily created, reused across searches so the TLS handshake and
+        # connection pool survive between queries
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_lock = asyncio.Lock()
+        # Outbound rate limit to Google: 2 req/s sustained, bursts of 4
+        self._bucket = _Bucket(rate=2.0, capacity=4)
+
+    async def _get_client(self) -> httpx.AsyncClient:
+        """Return the shared HTTP client, creating it on first use"""
+        async with self._client_lock:
+            if self._client is None:
+                self._client = httpx.AsyncClient(
+                    timeout=self.timeout,
+                    limits=httpx.Limits(
+                        max_connections=1000,
+                        max_keepalive_connections=100,
+                        keepalive_expiry=15.0
+                    ),
+                    headers={"User-Agent": self.user_agent},
+                    http2=True
+                )
+            return self._client
+
+    async def aclose(self):
+        """Close the shared HTTP client on shutdown"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
     async def search_google(self, query: str, num_results: int = 5) -> SearchResponse:
         """Perform Google search without API keys"""
-        logger.info("Performing Google search", extra={"query": query[:50]})
+        # Gate so a WARNING-level deployment allocates nothing here
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Performing Google search", extra={"query": query[:50]})
         
         # Validate input
         validation_error = validate_search_query(query)
@@ -58,10 +143,12 @@ class SearchService:
             
             return SearchResponse(
                 ok=True,
-                results=results,
+                titles=[r.title for r in results],
+                snippets=[r.snippet for r in results],
+                urls=[r.url for r in results],
                 query=clean_query
             )
-            
+
         except Exception as e:
             logger.error("Error performing search", exc_info=True)
             
@@ -82,7 +169,9 @@ class SearchService:
             
             return SearchResponse(
                 ok=True,
-                results=fallback_results,
+                titles=[r.title for r in fallback_results],
+                snippets=[r.snippet for r in fallback_results],
+                urls=[r.url for r in fallback_results],
                 query=clean_query
             )
     
@@ -102,35 +191,86 @@ class SearchService:
             'Connection': 'keep-alive',
         }
         
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            # Add a small delay to be respectful
-            await asyncio.sleep(0.5)
-            
-            response = await client.get(self.base_url, params=params, headers=headers)
-            response.raise_for_status()
-            
-            return self._parse_search_page(response.text)
+        client = await self._get_client()
+
+        # Rate-limit admission: free under light load, throttles bursts
+        await self._bucket.take()
+
+        response = await client.get(self.base_url, params=params, headers=headers)
+        response.raise_for_status()
+
+        return self._parse_search_page(response.text)
     
     def _parse_search_page(self, html: str) -> List[SearchResult]:
         """Parse Google search results from HTML"""
-        soup = BeautifulSoup(html, 'html.parser')
+        if LXML_AVAILABLE:
+            return self._parse_search_page_lxml(html)
+        return self._parse_search_page_soup(html)
+
+    def _parse_search_page_lxml(self, html: str) -> List[SearchResult]:
+        """Parse with lxml and process-lifetime compiled selectors"""
+        tree = lxml_html.fromstring(html)
         results = []
-        
-        # Try multiple selectors as Google changes their HTML structure frequently
-        search_selectors = [
-            'div.g',  # Traditional selector
-            'div[data-sokoban-container]',  # Alternative selector
-            'div.tF2Cxc',  # Another common selector
-            'div.MjjYud'  # Yet another selector
-        ]
-        
-        search_results = []
-        for selector in search_selectors:
-            search_results = soup.select(selector)
-            if search_results:
-                logger.info(f"Found {len(search_results)} results using selector: {selector}")
-                break
-        
+
+        search_results = _SEL_RESULT(tree)
+        if search_results:
+            logger.info(f"Found {len(search_results)} result containers")
+        else:
+            # Fallback: nearest div ancestor of each h3, as one XPath query
+            # instead of a Python parent walk; dict.fromkeys deduplicates
+            # shared ancestors while preserving document order
+            logger.warning("Standard selectors failed, trying fallback approach")
+            search_results = list(dict.fromkeys(_SEL_H3_DIV_ANCESTOR(tree)))
+
+        for result in search_results:
+            try:
+                title_elem = next(iter(_SEL_TITLE(result)), None)
+                if title_elem is None:
+                    continue
+                title = title_elem.text_content().strip()
+
+                link_elem = next(iter(_SEL_LINK(result)), None)
+                if link_elem is None:
+                    continue
+                url = link_elem.get('href')
+
+                # Clean up URL if it's a Google redirect
+                redirect = _GOOGLE_REDIRECT_RE.match(url)
+                if redirect:
+                    url = urllib.parse.unquote(redirect.group(1))
+                elif url.startswith('/search?'):
+                    continue  # Skip internal Google search links
+
+                snippet_elem = next(iter(_SEL_SNIPPET(result)), None)
+                snippet = snippet_elem.text_content().strip() if snippet_elem is not None else ""
+
+                # Validate URL
+                if not url.startswith(_HTTP_PREFIXES):
+                    continue
+
+                if title and url:
+                    results.append(SearchResult(
+                        title=sanitize_text(title),
+                        snippet=sanitize_text(snippet) if snippet else "No description available",
+                        url=url
+                    ))
+
+            except Exception as e:
+                logger.warning(f"Error parsing search result: {e}")
+                continue
+
+        logger.info(f"Parsed {len(results)} search results")
+        return results
+
+    def _parse_search_page_soup(self, html: str) -> List[SearchResult]:
+        """BeautifulSoup fallback parser, used when lxml is unavailable"""
+        soup = BeautifulSoup(html, 'html.parser', parse_only=_STRAINER)
+        results = []
+
+        search_results = soup.select(_RESULT_SELECTOR)
+        if search_results:
+            logger.info(f"Found {len(search_results)} result containers")
+
         if not search_results:
             # Fallback: look for any div with an h3 and a link
             logger.warning("Standard selectors failed, trying fallback approach")
@@ -148,42 +288,36 @@ class SearchService:
                 title_elem = result.find('h3')
                 if not title_elem:
                     # Try alternative selectors
-                    title_elem = result.select_one('h3, .LC20lb, .DKV0Md')
-                
+                    title_elem = result.select_one(_TITLE_SELECTOR)
+
                 if not title_elem:
                     continue
-                    
+
                 title = title_elem.get_text(strip=True)
-                
+
                 # Extract URL - try multiple approaches
                 link_elem = result.find('a')
                 if not link_elem:
                     link_elem = result.select_one('a[href]')
-                
+
                 if not link_elem or not link_elem.get('href'):
                     continue
-                    
+
                 url = link_elem['href']
-                
+
                 # Clean up URL if it's a Google redirect
-                if url.startswith('/url?q='):
-                    url = urllib.parse.unquote(url.split('/url?q=')[1].split('&')[0])
+                redirect = _GOOGLE_REDIRECT_RE.match(url)
+                if redirect:
+                    url = urllib.parse.unquote(redirect.group(1))
                 elif url.startswith('/search?'):
                     continue  # Skip internal Google search links
-                
-                # Extract snippet - try multiple selectors
-                snippet_selectors = [
-                    '.aCOpRe', '.VwiC3b', '.s3v9rd', '.st', '.IsZvec'
-                ]
-                snippet = ""
-                for selector in snippet_selectors:
-                    snippet_elem = result.select_one(selector)
-                    if snippet_elem:
-                        snippet = snippet_elem.get_text(strip=True)
-                        break
-                
+
+                # Extract snippet - one union selector instead of five passes
+                snippet_elem = result.select_one(_SNIPPET_SELECTOR)
+                snippet = snippet_elem.get_text(strip=True) if snippet_elem else ""
+
                 # Validate URL
-                if not url.startswith(('http://', 'https://')):
+                if not url.startswith(_HTTP_PREFIXES):
                     continue
                 
                 if title and url:
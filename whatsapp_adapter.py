@@ -1,20 +1,21 @@
 # whatsapp_adapter.py
 import os
-import json
+import sys
 import asyncio
-import threading
 import logging
-from typing import Dict, Any
+import time
+from collections import defaultdict, deque
+from typing import Dict, Any, List, Optional
 import httpx
 from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, Field
 from starlette.responses import PlainTextResponse
 
 # import the get_weather tool function directly from your MCP module
 # Make sure puch.py does NOT call mcp.run() on import (it shouldn't).
 from puch import get_weather  # <- your MCP module (ensure function importable)
 
-from mcp.server.fastmcp import FastMCP
-
 # --- config / env ---
 WHATSAPP_TOKEN = os.getenv("WHATSAPP_TOKEN")          # Page Access Token
 WHATSAPP_PHONE_ID = os.getenv("WHATSAPP_PHONE_ID")    # Phone number id (e.g. 1081234567890)
@@ -30,7 +31,49 @@ if not WHATSAPP_TOKEN or not WHATSAPP_PHONE_ID:
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("puch.whatsapp")
 
-app = FastAPI()
+# ORJSONResponse serializes responses in native code instead of stdlib json
+app = FastAPI(default_response_class=ORJSONResponse)
+
+# Typed views of Meta's webhook envelope - pydantic v2 parses these in its
+# Rust core, an order of magnitude faster than stdlib json into plain dicts
+class WAText(BaseModel):
+    body: str = ""
+
+class WAMessage(BaseModel):
+    from_: Optional[str] = Field(default=None, alias="from")
+    text: Optional[WAText] = None
+
+class WAValue(BaseModel):
+    messages: List[WAMessage] = []
+
+class WAChange(BaseModel):
+    value: WAValue = WAValue()
+
+class WAEntry(BaseModel):
+    changes: List[WAChange] = []
+
+class WAEnvelope(BaseModel):
+    entry: List[WAEntry] = []
+
+# shared client for Graph API sends - created on startup so the TLS
+# handshake to graph.facebook.com is paid once, not per reply
+WA_CLIENT: Optional[httpx.AsyncClient] = None
+
+@app.on_event("startup")
+async def _startup():
+    global WA_CLIENT
+    WA_CLIENT = httpx.AsyncClient(
+        timeout=httpx.Timeout(connect=3.0, read=5.0, write=2.0, pool=1.0),
+        limits=httpx.Limits(max_connections=200, max_keepalive_connections=50, keepalive_expiry=30.0),
+        http2=True,
+    )
+
+@app.on_event("shutdown")
+async def _shutdown():
+    global WA_CLIENT
+    if WA_CLIENT is not None:
+        await WA_CLIENT.aclose()
+        WA_CLIENT = None
 
 # simple health
 @app.get("/healthz")
@@ -50,49 +93,114 @@ async def webhook_verify(request: Request):
     logger.warning("Webhook verification failed")
     raise HTTPException(status_code=403, detail="Verification token mismatch")
 
+# Bound on concurrently processed inbound messages, to respect Graph API limits
+_SEND_SEMAPHORE = asyncio.Semaphore(50)
+
+# Fixed-window admission per sender so one spammy number can't amplify
+# load onto OpenWeather and the Graph API
+_WA_WINDOWS: Dict[str, deque] = defaultdict(deque)
+_WA_NOTIFIED: Dict[str, float] = {}
+_WA_WINDOW_SEC = 60.0
+_WA_LIMIT = 10
+_WA_MAX_SENDERS = 4096
+
+def _evict_idle_senders(now: float):
+    """Drop tracking state for senders whose window has fully elapsed"""
+    if len(_WA_WINDOWS) <= _WA_MAX_SENDERS:
+        return
+    cutoff = now - _WA_WINDOW_SEC
+    for phone in [p for p, dq in _WA_WINDOWS.items() if not dq or dq[-1] < cutoff]:
+        del _WA_WINDOWS[phone]
+    for phone in [p for p, ts in _WA_NOTIFIED.items() if ts < cutoff]:
+        del _WA_NOTIFIED[phone]
+
+def _admit(phone: str) -> bool:
+    """Allow at most _WA_LIMIT messages per sender per window"""
+    now = time.monotonic()
+    _evict_idle_senders(now)
+    dq = _WA_WINDOWS[phone]
+    cutoff = now - _WA_WINDOW_SEC
+    while dq and dq[0] < cutoff:
+        dq.popleft()
+    if len(dq) >= _WA_LIMIT:
+        return False
+    dq.append(now)
+    return True
+
+def _should_notify(phone: str) -> bool:
+    """At most one 'slow down' reply per sender per window"""
+    now = time.monotonic()
+    last = _WA_NOTIFIED.get(phone)
+    if last is not None and now - last < _WA_WINDOW_SEC:
+        return False
+    _WA_NOTIFIED[phone] = now
+    return True
+
+async def _notify_rate_limited(phone: str):
+    """Send the throttle notice under the same cap as normal replies"""
+    async with _SEND_SEMAPHORE:
+        await send_whatsapp_text(
+            to=phone,
+            text="Rate limited - please wait a minute before asking again."
+        )
+
+async def _handle_one(from_number: str, text: str):
+    """Process a single inbound message: weather lookup + WhatsApp reply"""
+    async with _SEND_SEMAPHORE:
+        # rudimentary command parsing: "weather Mumbai" OR "Mumbai"
+        # keep it flexible for users; lowercase once, slice off the
+        # 8-char "weather " prefix without re-walking the string
+        cmd = text[8:].strip() if text.lower().startswith("weather ") else text
+
+        # call your get_weather tool (it's async)
+        # If get_weather lives in puch.py and is decorated as @mcp.tool(),
+        # it is still a normal function we can call directly.
+        result = await get_weather(cmd)  # expects dict {ok: True/False, ...}
+
+        # format reply
+        if result.get("ok"):
+            unit_sym = "°C" if result.get("units", "metric") == "metric" else "°F"
+            body = (
+                f"Weather for {result.get('city')}, {result.get('country')}\n"
+                f"Temp: {result.get('temp')}{unit_sym} (feels like {result.get('feels_like')}{unit_sym})\n"
+                f"Conditions: {result.get('conditions')}\n"
+                f"Humidity: {result.get('humidity')}%\n"
+            )
+        else:
+            body = f"Error: {result.get('detail', 'Could not fetch weather.')}"
+
+        # send reply through WhatsApp Cloud API
+        await send_whatsapp_text(to=from_number, text=body)
+
 # incoming messages (POST)
 @app.post("/webhook")
-async def webhook_inbound(payload: Dict[str, Any]):
+async def webhook_inbound(payload: WAEnvelope):
     # Meta sends a complex envelope - follow their structure.
     # For each entry -> changes -> value -> messages
     try:
-        entries = payload.get("entry", [])
-        for entry in entries:
-            for change in entry.get("changes", []):
-                value = change.get("value", {})
-                messages = value.get("messages", [])
-                for msg in messages:
-                    from_number = msg.get("from")  # sender phone
-                    text = msg.get("text", {}).get("body", "").strip()
-                    if not text:
+        coros = []
+        for entry in payload.entry:
+            for change in entry.changes:
+                for msg in change.value.messages:
+                    from_number = msg.from_  # sender phone
+                    text = msg.text.body.strip() if msg.text else ""
+                    if not from_number or not text:
                         # ignore non-text for now
                         continue
+                    if not _admit(from_number):
+                        logger.warning("Rate limited sender %s", from_number)
+                        if _should_notify(from_number):
+                            coros.append(_notify_rate_limited(from_number))
+                        continue
+                    coros.append(_handle_one(from_number, text))
+
+        # Overlap the weather fetches and replies: wall time for a batch is
+        # roughly the slowest message, not the sum of all of them
+        results = await asyncio.gather(*coros, return_exceptions=True)
+        for r in results:
+            if isinstance(r, Exception):
+                logger.error("Message handling failed: %r", r)
 
-                    # rudimentary command parsing: "weather Mumbai" OR "Mumbai"
-                    # keep it flexible for users
-                    cmd = text
-                    if text.lower().startswith("weather "):
-                        cmd = text[len("weather "):].strip()
-
-                    # call your get_weather tool (it's async)
-                    # If get_weather lives in puch.py and is decorated as @mcp.tool(),
-                    # it is still a normal function we can call directly.
-                    result = await get_weather(cmd)  # expects dict {ok: True/False, ...}
-
-                    # format reply
-                    if result.get("ok"):
-                        unit_sym = "°C" if result.get("units", "metric") == "metric" else "°F"
-                        body = (
-                            f"Weather for {result.get('city')}, {result.get('country')}\n"
-                            f"Temp: {result.get('temp')}{unit_sym} (feels like {result.get('feels_like')}{unit_sym})\n"
-                            f"Conditions: {result.get('conditions')}\n"
-                            f"Humidity: {result.get('humidity')}%\n"
-                        )
-                    else:
-                        body = f"Error: {result.get('detail', 'Could not fetch weather.')}"
-
-                    # send reply through WhatsApp Cloud API
-                    await send_whatsapp_text(to=from_number, text=body)
         return {"status": "processed"}
     except Exception as e:
         logger.exception("Error processing webhook")
@@ -100,6 +208,8 @@ async def webhook_inbound(payload: Dict[str, Any]):
 
 # helper to send message via Graph API
 async def send_whatsapp_text(to: str, text: str):
+    if WA_CLIENT is None:
+        raise RuntimeError("WhatsApp client not initialized - the FastAPI startup hook has not run")
     headers = {"Authorization": f"Bearer {WHATSAPP_TOKEN}", "Content-Type": "application/json"}
     payload = {
         "messaging_product": "whatsapp",
@@ -107,29 +217,30 @@ async def send_whatsapp_text(to: str, text: str):
         "type": "text",
         "text": {"preview_url": False, "body": text}
     }
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        resp = await client.post(GRAPH_URL, headers=headers, json=payload)
-        if resp.status_code not in (200, 201):
-            logger.error("Failed to send message: %s %s", resp.status_code, resp.text)
-        else:
-            logger.info("Sent message to %s", to)
-        return resp
-
-# --- run MCP server in background thread so this single container can serve both endpoints ---
-mcp = FastMCP("Puch.AI Weather Server")
-
-def start_mcp_in_thread():
-    def _run():
-        try:
-            mcp.run()  # blocking call to start MCP
-        except Exception:
-            logger.exception("MCP server crashed")
-    t = threading.Thread(target=_run, daemon=True)
-    t.start()
+    resp = await WA_CLIENT.post(GRAPH_URL, headers=headers, json=payload)
+    if resp.status_code not in (200, 201):
+        logger.error("Failed to send message: %s %s", resp.status_code, resp.text)
+    else:
+        logger.info("Sent message to %s", to)
+    return resp
 
 # start app (uvicorn) entrypoint
 if __name__ == "__main__":
     import uvicorn
-    logger.info("Starting combined WhatsApp adapter + MCP server")
-    start_mcp_in_thread()
-    uvicorn.run("whatsapp_adapter:app", host="0.0.0.0", port=PORT, log_level="info")
+    logger.info("Starting WhatsApp adapter")
+    # uvloop + httptools replace the stdlib selector loop and h11 parser
+    # with C implementations; multiple workers sidestep the single-GIL
+    # ceiling for CPU-bound JSON/parsing work. uvloop doesn't build on
+    # Windows (and isn't installed there), so fall back to uvicorn's
+    # auto-detected loop for the .bat/.ps1 launch paths.
+    # NB: the per-sender rate limiter is per-process, so with N workers a
+    # sender effectively gets _WA_LIMIT * N messages per window.
+    uvicorn.run(
+        "whatsapp_adapter:app",
+        host="0.0.0.0",
+        port=PORT,
+        log_level="info",
+        loop="uvloop" if sys.platform != "win32" else "auto",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", max(2, os.cpu_count() or 2))),
+    )